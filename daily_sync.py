@@ -1,32 +1,64 @@
 import os
 import datetime
 import logging
+import logging.handlers
+import queue
+import atexit
 import subprocess
 from rclone_python import rclone
 import hashlib
+import xxhash
 import json
-from typing import List, Dict, Optional
+import gzip
+import orjson
+import ijson
+import re
+from typing import List, Dict, Iterable, Iterator, Optional
 import argparse
+import asyncio
+import time
+import functools
+import tempfile
+import glob
 
 # Cấu hình toàn cục
 CONFIG = {
     "MAX_TRANSFER_GB": 500,
     "LOG_DIR": "logs",
     "CACHE_DIR": "cache",
+    "CACHE_MAX_AGE_DAYS": 7,
+    "MAX_CONCURRENT_RCLONE": 8,
+    "FILES_FROM_CHUNK_SIZE": 256,
+    # Tổng giới hạn cho cả lần chạy, được chia đều cho các tiến trình rclone copy chạy đồng thời
+    "TPSLIMIT_TOTAL": 4,
+    "BWLIMIT_TOTAL_KB": 5 * 1024,
+    # Số file mỗi lệnh rclone copy --files-from-raw tải song song (copyto thử lại từng file dùng 1)
+    "COPY_TRANSFERS": 2,
     "RCLONE_ARGS": [
         "--drive-chunk-size", "64M",
-        "--tpslimit", "4",
-        "--transfers", "2",
-        "--log-level", "DEBUG",
         "--retries", "3",
-        "--retries-sleep", "5s",
-        "--bwlimit", "5M"
+        "--retries-sleep", "5s"
     ]
 }
 
 RemoteConfig = None
+# Cache kết quả rclone about theo tên remote: (total, free)
+RemoteAbout: Dict[str, tuple[int, int]] = {}
 logger = logging.getLogger("rclone_sync")
-logger.setLevel(logging.DEBUG)
+# Mức log của script, độc lập với --log-level truyền cho rclone
+logger.setLevel(logging.INFO)
+# Giới hạn số lô file được copy đồng thời (mỗi lô chạy tối đa một tiến trình rclone tại một thời điểm)
+copy_slots = asyncio.Semaphore(CONFIG["MAX_CONCURRENT_RCLONE"])
+# Các từ khóa báo lỗi vượt quota / rate limit trong output của rclone. Mã HTTP phải đứng riêng,
+# không dính chữ/số/-/. vì stderr của một lô có chứa tên file (ví dụ IMG_4290.mkv, IMG-403.jpg)
+QUOTA_RE = re.compile(r"quotaexceeded|userratelimitexceeded|(?<![\w.-])(?:403|429)(?![\w.-])|rate limit", re.IGNORECASE)
+# Lỗi rclone copyto khi file nguồn không còn tồn tại: không thấy file thì rclone coi nguồn là thư mục
+# và báo "directory not found" (thư mục đích thiếu thì copyto tự tạo nên không gặp lỗi này)
+SOURCE_MISSING_RE = re.compile(r"\bdirectory not found\b", re.IGNORECASE)
+# --tpslimit/--bwlimit cho mỗi tiến trình rclone copy, main gán lại bằng set_rate_limits trước mỗi lần copy
+RateLimitArgs: List[str] = []
+# Cache danh sách file theo thư mục đích cho file_exists_at_dest, bỏ từng thư mục sau khi copy vào đó
+DestDirListing: Dict[str, frozenset] = {}
 
 
 def get_rclone_remote_type(remote_name: str) -> str | None:
@@ -56,196 +88,395 @@ def get_rclone_remote_type(remote_name: str) -> str | None:
 def setup_logging():
     os.makedirs(CONFIG["LOG_DIR"], exist_ok=True)
     log_file = os.path.join(CONFIG["LOG_DIR"], f"daily_sync_{datetime.date.today()}.log")
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler = logging.FileHandler(log_file, encoding='utf-8', delay=True)
     console_handler = logging.StreamHandler()
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Ghi log ở luồng nền: luồng chính chỉ đưa record vào hàng đợi
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
 
+@functools.lru_cache(maxsize=1024)
 def sanitize_path(remote_path: str) -> str:
+    return xxhash.xxh64(remote_path.encode()).hexdigest()
+
+def legacy_sanitize_path(remote_path: str) -> str:
+    """
+    Tên file cache của bản cũ (md5), chỉ dùng để chuyển cache cũ sang tên mới
+    """
     return hashlib.md5(remote_path.encode()).hexdigest()
 
+def migrate_legacy_cache(file_paths: List[str], legacy_file_paths: List[str]):
+    """
+    Chuyển bộ file .json của bản cũ (tên theo md5, chưa nén) sang tên mới nếu file đầu tiên của bộ cũ
+    mới hơn, ngược lại xóa bộ cũ. Các file trong một bộ luôn được chuyển/xóa cùng nhau.
+    File được giữ dạng .json vì load_json_from_file vẫn đọc được
+    """
+    if not os.path.exists(legacy_file_paths[0]):
+        return
+    current_file = next((path for path in (f"{file_paths[0]}.gz", file_paths[0]) if os.path.exists(path)), None)
+    use_legacy = current_file is None or os.path.getmtime(legacy_file_paths[0]) > os.path.getmtime(current_file)
+    for file_path, legacy_file_path in zip(file_paths, legacy_file_paths):
+        if use_legacy:
+            # Bản .gz được ưu tiên khi đọc nên phải xóa để bản cũ được dùng
+            for current_path in (f"{file_path}.gz", file_path):
+                if os.path.exists(current_path):
+                    os.remove(current_path)
+            if os.path.exists(legacy_file_path):
+                os.replace(legacy_file_path, file_path)
+        elif os.path.exists(legacy_file_path):
+            os.remove(legacy_file_path)
+
+def remove_legacy_cached_files(remote_path: str, cache_type: str):
+    """
+    Xóa cache danh sách file của bản cũ ({md5}_{type}_{ngày}.json). Bản cũ không lưu ModTime
+    của thư mục gốc nên không dùng lại được, lần chạy này liệt kê lại remote_path
+    """
+    pattern = os.path.join(CONFIG["CACHE_DIR"], f"{legacy_sanitize_path(remote_path)}_{cache_type}_*.json")
+    for legacy_cache_file in glob.glob(pattern):
+        os.remove(legacy_cache_file)
+
 def check_remote_exists(remote_path: str) -> bool:
-    logger.debug(f"🔍 Kiểm tra sự tồn tại của thư mục: {remote_path}")
+    logger.debug("🔍 Kiểm tra sự tồn tại của thư mục: %s", remote_path)
     try:
         result = rclone.ls(remote_path, max_depth=1)
-        logger.debug(f"✅ Thư mục tồn tại: {remote_path}")
+        logger.debug("✅ Thư mục tồn tại: %s", remote_path)
         return True
     except Exception as e:
-        logger.error(f"❌ Thư mục không tồn tại hoặc lỗi khi kiểm tra {remote_path}: {str(e)}")
+        logger.error("❌ Thư mục không tồn tại hoặc lỗi khi kiểm tra %s: %s", remote_path, str(e))
         return False
 
+async def run_rclone(cmd: List[str], capture_stdout: bool = True) -> subprocess.CompletedProcess:
+    """
+    Chạy lệnh rclone bằng asyncio subprocess. capture_stdout=False bỏ stdout vào DEVNULL
+    khi không cần đọc output. Lỗi được ném ra dưới dạng subprocess.CalledProcessError
+    giống subprocess.run(check=True)
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        # Task bị hủy (hết giờ, vượt quota...): dừng luôn tiến trình rclone
+        proc.kill()
+        await proc.wait()
+        raise
+    stdout = stdout.decode('utf-8', errors='replace') if stdout is not None else None
+    stderr = stderr.decode('utf-8', errors='replace')
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+def stream_remote_files(remote_path: str) -> Iterator[Dict]:
+    """
+    Liệt kê đệ quy file trong remote_path bằng rclone lsjson --fast-list, đọc dần output
+    bằng ijson và chỉ giữ các trường dùng khi so sánh/copy.
+    Lỗi của rclone được ném ra dưới dạng subprocess.CalledProcessError sau khi đọc hết output
+    """
+    cmd = ["rclone", "lsjson", remote_path, "--recursive", "--fast-list", "--files-only", "--hash", "--no-mimetype"]
+    with tempfile.TemporaryFile() as stderr, subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr) as proc:
+        try:
+            for item in ijson.items(proc.stdout, 'item'):
+                yield {"Path": item["Path"], "Size": item["Size"], "ModTime": item.get("ModTime", ""), "Hashes": item.get("Hashes", {})}
+        except ijson.JSONError:
+            # rclone lỗi thì stdout rỗng/dở dang: ưu tiên báo lỗi của rclone
+            if proc.wait() == 0:
+                raise
+        if proc.wait() != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(proc.returncode, cmd, None, stderr.read().decode('utf-8', errors='replace'))
+
+def get_remote_modtime(remote_path: str) -> Optional[str]:
+    """
+    Lấy ModTime của chính thư mục remote_path bằng rclone lsjson --stat (không liệt kê nội dung)
+    """
+    cmd = ["rclone", "lsjson", "--stat", remote_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', check=True)
+        return json.loads(result.stdout).get("ModTime")
+    except subprocess.CalledProcessError as e:
+        logger.debug("⚠️ Không thể lấy ModTime của %s: %s", remote_path, e.stderr)
+        return None
+    except (json.JSONDecodeError, AttributeError) as e:
+        logger.debug("⚠️ Không thể đọc ModTime của %s: %s", remote_path, e)
+        return None
+
+def get_cached_files_paths(remote_path: str, is_source: bool = True) -> tuple[str, str]:
+    """
+    Trả về (file cache danh sách, file meta lưu ModTime của thư mục gốc) cho remote_path
+    """
+    wire_path = sanitize_path(remote_path)
+    cache_type = 'source' if is_source else 'dest'
+    cache_file = os.path.join(CONFIG["CACHE_DIR"], f"{wire_path}_{cache_type}.jsonl")
+    meta_file = os.path.join(CONFIG["CACHE_DIR"], f"{wire_path}_{cache_type}.meta.json")
+    return cache_file, meta_file
+
+def invalidate_cached_files(remote_path: str, is_source: bool = True):
+    """
+    Buộc lần get_cached_files sau liệt kê lại remote_path (ví dụ sau khi đã copy file vào đích)
+    """
+    _, meta_file = get_cached_files_paths(remote_path, is_source)
+    for file_path in (meta_file, f"{meta_file}.gz"):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
 def get_cached_files(remote_path: str, is_source: bool = True) -> List[Dict]:
     os.makedirs(CONFIG["CACHE_DIR"], exist_ok=True)
-    today = datetime.datetime.now().strftime('%Y-%m-%d')
-    wire_path = sanitize_path(remote_path)
     cache_type = 'source' if is_source else 'dest'
-    cache_file = os.path.join(CONFIG["CACHE_DIR"], f"{wire_path}_{cache_type}_{today}.json")
+    cache_file, meta_file = get_cached_files_paths(remote_path, is_source)
+    remove_legacy_cached_files(remote_path, cache_type)
+    today = datetime.date.today()
+    modtime = get_remote_modtime(remote_path)
     
-    if os.path.exists(cache_file):
-        logger.info(f"📦 Sử dụng cache từ: {cache_file}")
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    
-    # Kiểm tra sự tồn tại của thư mục gốc
-    if not check_remote_exists(remote_path):
-        if is_source:
-            logger.error(f"❌ Bỏ qua đồng bộ vì thư mục nguồn không tồn tại: {remote_path}")
-            return []
-        else:
-            logger.info(f"📁 Thư mục đích không tồn tại: {remote_path}. Trả về cache rỗng")
-            with open(cache_file, 'w', encoding='utf-8') as f:
-                json.dump([], f, ensure_ascii=False, indent=2)
-            return []
+    # Cache đích dùng lại qua nhiều ngày nếu ModTime của thư mục gốc không đổi. Cache nguồn chỉ dùng
+    # trong ngày: ModTime thư mục gốc không đổi khi thêm file ở thư mục con nên không đủ để phát hiện file mới
+    max_age_days = 1 if is_source else CONFIG["CACHE_MAX_AGE_DAYS"]
+    if os.path.exists(f"{cache_file}.gz") and json_file_exists(meta_file):
+        meta = load_json_from_file(meta_file)
+        cache_age = (today - datetime.date.fromisoformat(meta.get("CachedAt", "1970-01-01"))).days
+        if modtime and meta.get("ModTime") == modtime and cache_age < max_age_days:
+            logger.info(f"📦 Sử dụng cache từ: {cache_file} (ModTime {modtime} không đổi)")
+            return load_jsonl_from_file(cache_file)
+        logger.info(f"🔄 Cache của {remote_path} đã cũ (ModTime: {meta.get('ModTime')} -> {modtime}, {cache_age} ngày)")
     
     logger.info(f"🔄 Tạo mới cache cho: {remote_path} ({cache_type}) witch path {cache_file}")
     try:
-        items = rclone.ls(remote_path, max_depth=9999, args=["--hash"])
-        files = [item for item in items if not item.get("IsDir", False)]
-        
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(files, f, ensure_ascii=False, indent=2)
-        return files
+        # Ghi thẳng từng file vào cache trong lúc rclone đang liệt kê, không giữ toàn bộ output trong bộ nhớ
+        save_jsonl_to_file(stream_remote_files(remote_path), cache_file)
+    except subprocess.CalledProcessError as e:
+        # Không kiểm tra trước bằng check_remote_exists: suy ra từ lỗi của lần liệt kê
+        if "directory not found" in e.stderr:
+            if is_source:
+                logger.error(f"❌ Bỏ qua đồng bộ vì thư mục nguồn không tồn tại: {remote_path}")
+                return []
+            logger.info(f"📁 Thư mục đích không tồn tại: {remote_path}. Trả về cache rỗng")
+            save_jsonl_to_file([], cache_file)
+            return []
+        logger.error(f"❌ Lỗi khi liệt kê file: {e.stderr}")
+        return []
     except Exception as e:
         logger.error(f"❌ Lỗi khi liệt kê file: {str(e)}")
         return []
 
-def get_file_hash(remote_path: str, algo: str = 'md5') -> Optional[str]:
-    logger.debug(f"🔍 Đang lấy hash của {remote_path} with also is {algo}")
+    if modtime:
+        save_json_to_file({"ModTime": modtime, "CachedAt": today.isoformat()}, meta_file)
+    return load_jsonl_from_file(cache_file)
+
+async def get_file_hash(remote_path: str, algo: str = 'md5') -> Optional[str]:
+    logger.debug("🔍 Đang lấy hash của %s with also is %s", remote_path, algo)
     cmd = ["rclone", "hashsum", algo, remote_path]
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', check=True)
+        result = await run_rclone(cmd)
         if result.stdout:
             hash_value = result.stdout.split(maxsplit=1)[0]
-            logger.debug(f"✅ Hash của {remote_path}: {hash_value}")
+            logger.debug("✅ Hash của %s: %s", remote_path, hash_value)
             return hash_value
-        logger.warning(f"⚠️ Không có hash trả về cho {remote_path}")
+        logger.warning("⚠️ Không có hash trả về cho %s", remote_path)
         return None
     except subprocess.CalledProcessError as e:
-        logger.warning(f"⚠️ Không thể lấy hash của {remote_path}: {e.stderr}")
+        logger.warning("⚠️ Không thể lấy hash của %s: %s", remote_path, e.stderr)
         return None
 
 def is_quota_exceeded(error_msg: str) -> bool:
-    keywords = ['quotaExceeded', 'userRateLimitExceeded', '403', '429', 'Rate Limit']
-    return any(k.lower() in error_msg.lower() for k in keywords)
+    return bool(QUOTA_RE.search(error_msg))
 
-def file_exists_at_dest(dest_path: str, file_path: str) -> bool:
+async def _list_dir_cached(dir_path: str) -> frozenset:
+    """
+    Liệt kê tên file trong thư mục bằng rclone lsf, mỗi thư mục chỉ gọi một lần
+    """
+    if dir_path in DestDirListing:
+        return DestDirListing[dir_path]
+    cmd = ["rclone", "lsf", dir_path]
+    try:
+        result = await run_rclone(cmd)
+        files = frozenset(result.stdout.splitlines())
+    except subprocess.CalledProcessError as e:
+        if "directory not found" not in e.stderr:
+            raise
+        logger.info("📁 Thư mục đích %s chưa tồn tại", dir_path)
+        files = frozenset()
+    DestDirListing[dir_path] = files
+    return files
+
+async def file_exists_at_dest(dest_path: str, file_path: str) -> bool:
     file_name = os.path.basename(file_path)
     dir_path = os.path.dirname(dest_path) or ""
     
-    logger.debug(f"🔍 Đang kiểm tra file tồn tại tại đích: {dest_path}")
-    cmd = ["rclone", "lsf", dir_path]
+    logger.debug("🔍 Đang kiểm tra file tồn tại tại đích: %s", dest_path)
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', check=True)
-        files = result.stdout.splitlines()
-        logger.debug(f"📋 Danh sách file trong {dir_path}: {files}")
+        files = await _list_dir_cached(dir_path)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Danh sách file trong %s: %s", dir_path, sorted(files))
         exists = file_name in files
-        logger.debug(f"✅ Kết quả kiểm tra {dest_path}: {'tồn tại' if exists else 'không tồn tại'}")
+        logger.debug("✅ Kết quả kiểm tra %s: %s", dest_path, 'tồn tại' if exists else 'không tồn tại')
         return exists
     except subprocess.CalledProcessError as e:
-        if "directory not found" in e.stderr:
-            logger.info(f"📁 Thư mục đích {dir_path} chưa tồn tại")
-            return False
-        logger.warning(f"⚠️ Không thể kiểm tra file tồn tại tại {dest_path}: {e.stderr}")
+        logger.warning("⚠️ Không thể kiểm tra file tồn tại tại %s: %s", dest_path, e.stderr)
         return False
 
-def run_rclone_copy(src_path: str, dest_path: str) -> tuple[bool, str]:
-    cmd = ["rclone", "copyto", src_path, dest_path] + CONFIG["RCLONE_ARGS"]
+def set_rate_limits(processes: int):
+    """
+    Chia TPSLIMIT_TOTAL/BWLIMIT_TOTAL_KB cho số tiến trình rclone copy chạy đồng thời,
+    vì rclone áp dụng --tpslimit/--bwlimit cho từng tiến trình
+    """
+    processes = max(processes, 1)
+    RateLimitArgs[:] = [
+        "--tpslimit", f"{CONFIG['TPSLIMIT_TOTAL'] / processes:g}",
+        "--bwlimit", f"{CONFIG['BWLIMIT_TOTAL_KB'] // processes}k"
+    ]
+
+async def run_rclone_copy(src_path: str, dest_path: str) -> tuple[bool, str]:
+    cmd = ["rclone", "copyto", src_path, dest_path, "--transfers", "1"] + CONFIG["RCLONE_ARGS"] + RateLimitArgs
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', check=True)
-        return True, result.stdout
+        await run_rclone(cmd, capture_stdout=False)
+        # Danh sách thư mục đích đã thay đổi, bỏ cache lsf của thư mục đó
+        DestDirListing.pop(os.path.dirname(dest_path), None)
+        return True, ""
     except subprocess.CalledProcessError as e:
         return False, f"Exit code {e.returncode}: {e.stderr}"
 
-def delete_file(remote_path: str) -> bool:
-    logger.debug(f"🗑️ Đang xóa file: {remote_path}")
+async def delete_file(remote_path: str) -> bool:
+    logger.debug("🗑️ Đang xóa file: %s", remote_path)
     cmd = ["rclone", "delete", remote_path]
     try:
-        subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', check=True)
-        logger.debug(f"✅ Đã xóa file: {remote_path}")
+        await run_rclone(cmd, capture_stdout=False)
+        logger.debug("✅ Đã xóa file: %s", remote_path)
         return True
     except subprocess.CalledProcessError as e:
-        logger.warning(f"⚠️ Không thể xóa file {remote_path}: {e.stderr}")
+        logger.warning("⚠️ Không thể xóa file %s: %s", remote_path, e.stderr)
         return False
 
-def get_cached_sync_source_file_name(source: str, destination: str) -> str:
+def get_cached_sync_source_file_name(source: str, destination: str, path_hash=sanitize_path) -> str:
     today = datetime.datetime.now().strftime('%Y-%m-%d')
-    return os.path.join(CONFIG["CACHE_DIR"], f"sync_list_{sanitize_path(source+destination)}_{today}.json")
+    return os.path.join(CONFIG["CACHE_DIR"], f"sync_list_{path_hash(source+destination)}_{today}.json")
 
-def get_cached_sync_source_file_name_success(source: str, destination: str) -> str:
-    return f"success_{get_cached_sync_source_file_name(source, destination)}"
+def get_cached_sync_source_file_name_success(source: str, destination: str, path_hash=sanitize_path) -> str:
+    return f"success_{get_cached_sync_source_file_name(source, destination, path_hash)}"
 
 def update_cache_file(source: str, destination: str):
     cache_file = get_cached_sync_source_file_name(source, destination)
     cache_file_status = get_cached_sync_source_file_name_success(source, destination)
-    logger.info(f"📦 Cập nhật cache file từ: {cache_file} va {cache_file_status}")
+    logger.info("📦 Cập nhật cache file từ: %s va %s", cache_file, cache_file_status)
     old_file = []
-    with open(cache_file, 'r', encoding='utf-8') as f:
-        old_file = json.load(f)
+    old_file = load_json_from_file(cache_file)
     
-    if os.path.exists(cache_file_status):
+    if json_file_exists(cache_file_status):
         success_file = []
-        logger.info(f"📦 Đang cập nhật danh sách file thành công từ: {cache_file_status}")
-        with open(cache_file_status, 'r', encoding='utf-8') as f:
-            success_file = json.load(f)
+        logger.info("📦 Đang cập nhật danh sách file thành công từ: %s", cache_file_status)
+        success_file = load_json_from_file(cache_file_status)
         new_file = []
         for file in old_file:
             if file['Path'] not in success_file:
                 new_file.append(file)
-                logger.info(f"📦 Thêm file mới cần copy: {file['Path']}")
+                logger.info("📦 Thêm file mới cần copy: %s", file['Path'])
         save_json_to_file(new_file, cache_file)
         return new_file
     else:
-        logger.info(f"📦 Không tìm thấy danh sách file thành công. Sử dụng danh sách file cần copy từ: {cache_file}")
+        logger.info("📦 Không tìm thấy danh sách file thành công. Sử dụng danh sách file cần copy từ: %s", cache_file)
         return old_file
     
 
-def get_files_to_copy(source: str, destination: str, hash_algo) -> List[Dict]:
+def is_same_size(src_size: int, dest_size: int) -> bool:
+    """
+    So sánh Size của rclone. Size < 0 (không biết kích thước, ví dụ Google Docs) ở một phía
+    thì coi như giống nhau, giống cách rclone bỏ qua phép so sánh kích thước.
+    """
+    if src_size < 0 or dest_size < 0:
+        return True
+    return src_size == dest_size
+
+def is_same_modtime(src_modtime: str, dest_modtime: str, window: float = 1.0) -> bool:
+    """
+    So sánh ModTime của rclone với sai số `window` giây (giống --modify-window).
+    Thiếu ModTime ở một phía thì coi như giống nhau.
+    """
+    if not src_modtime or not dest_modtime:
+        return True
+    try:
+        src_time = datetime.datetime.fromisoformat(re.sub(r"\.\d+", "", src_modtime).replace("Z", "+00:00"))
+        dest_time = datetime.datetime.fromisoformat(re.sub(r"\.\d+", "", dest_modtime).replace("Z", "+00:00"))
+    except ValueError:
+        return src_modtime == dest_modtime
+    return abs((src_time - dest_time).total_seconds()) <= window
+
+async def get_files_to_copy(source: str, destination: str, hash_algo) -> tuple[List[Dict], bool]:
+    """
+    Trả về (danh sách file cần copy, nguồn có file hay không)
+    """
     cache_file = get_cached_sync_source_file_name(source, destination)
+    migrate_legacy_cache(
+        [cache_file, get_cached_sync_source_file_name_success(source, destination)],
+        [get_cached_sync_source_file_name(source, destination, legacy_sanitize_path),
+         get_cached_sync_source_file_name_success(source, destination, legacy_sanitize_path)]
+    )
     
-    if os.path.exists(cache_file):
-        return update_cache_file(source, destination)
+    # Danh sách trong ngày chỉ được lưu khi nguồn có file
+    if json_file_exists(cache_file):
+        return update_cache_file(source, destination), True
     
     source_files = get_cached_files(source, is_source=True)
-    if not source_files and not check_remote_exists(source):
-        logger.error(f"❌ Không có file để đồng bộ từ {source}")
-        return []
+    if not source_files:
+        logger.error("❌ Không có file để đồng bộ từ %s", source)
+        return [], False
         
     dest_files = get_cached_files(destination, is_source=False)
     files_to_copy = []
     
-    # Create dictionary for faster lookup
-    dest_files_dict = {f['Path']: f for f in dest_files}
+    # Chỉ so sánh hash trên thuật toán mà cả nguồn và đích cùng có (khác backend thì thường không có),
+    # nếu không có thuật toán chung thì so sánh theo (Size, ModTime). Lấy mẫu từ file đầu tiên có hash
+    # vì Google Docs / file rỗng trả về Hashes rỗng
+    src_algos = next((set(f['Hashes']) for f in source_files if f.get('Hashes')), set())
+    dest_algos = next((set(f['Hashes']) for f in dest_files if f.get('Hashes')), set())
+    common_algos = src_algos & dest_algos
+    if hash_algo not in common_algos:
+        hash_algo = sorted(common_algos)[0] if common_algos else None
+    logger.info("🔍 So sánh nguồn và đích bằng: %s", hash_algo or 'Size + ModTime')
+    
+    # Create index for faster lookup: Path -> (Size, hash, ModTime)
+    dest_index = {
+        f['Path']: (f['Size'], f.get('Hashes', {}).get(hash_algo, '') if hash_algo else '', f.get('ModTime', ''))
+        for f in dest_files
+    }
     
     for src_file in source_files:
         src_path = src_file['Path']
-        src_hash = src_file.get('Hashes', {}).get('md5', '')
         
         # Check if file exists in destination
-        dest_file = dest_files_dict.get(src_path)
+        dest_entry = dest_index.get(src_path)
         
-        if dest_file:
-            # Compare hashes if file exists in both
-            if hash_algo is None:
-                logger.info(f"📌 File đã tồn tại ở đích: {src_path} (không kiểm tra hash)")
+        if dest_entry:
+            dest_size, dest_hash, dest_modtime = dest_entry
+            # Size differs: copyto overwrites the destination, no hash or delete needed
+            if not is_same_size(src_file['Size'], dest_size):
+                logger.info("🔄 Kích thước khác nhau, sẽ copy: %s (src: %s, dest: %s)", src_path, src_file['Size'], dest_size)
+                files_to_copy.append(src_file)
                 continue
 
-            dest_hash = dest_file.get('Hashes', {}).get(hash_algo, '')
-            if src_hash and dest_hash and src_hash != dest_hash:
-                logger.info(f"🔄 Hash khác nhau, sẽ copy: {src_path} (src: {src_hash}, dest: {dest_hash})")
-                delete_file(f"{destination}/{src_path}")
+            src_hash = src_file.get('Hashes', {}).get(hash_algo, '') if hash_algo else ''
+            if src_hash and dest_hash:
+                if src_hash != dest_hash:
+                    logger.info("🔄 Hash khác nhau, sẽ copy: %s (src: %s, dest: %s)", src_path, src_hash, dest_hash)
+                    await delete_file(f"{destination}/{src_path}")
+                    files_to_copy.append(src_file)
+            elif not is_same_modtime(src_file.get('ModTime', ''), dest_modtime):
+                # Không có hash chung (khác backend): so sánh kích thước + thời gian sửa đổi
+                logger.info("🔄 Thời gian sửa đổi khác nhau, sẽ copy: %s (src: %s, dest: %s)", src_path, src_file.get('ModTime'), dest_modtime)
                 files_to_copy.append(src_file)
         else:
-            logger.info(f"📌 File chưa tồn tại ở đích: {src_path}")
+            logger.info("📌 File chưa tồn tại ở đích: %s", src_path)
             files_to_copy.append(src_file)
     
     # Save the list to cache
-    with open(cache_file, 'w', encoding='utf-8') as f:
-        json.dump(files_to_copy, f, ensure_ascii=False, indent=2)
+    save_json_to_file(files_to_copy, cache_file)
     
-    return files_to_copy
+    return files_to_copy, True
 
 def parse_transfers(transfer_args: List[str]) -> List[Dict]:
     transfers = []
@@ -264,64 +495,254 @@ def extract_remote_name(remote_path: str) -> str:
         raise ValueError("Chuỗi không hợp lệ: thiếu dấu ':' để phân tách remote.")
     return remote_path.split(":", 1)[0]
 
-def get_gdrive_free_space_percent_from_path(remote_path: str) -> tuple[bool, float | str]:
-    try:
-        remote = extract_remote_name(remote_path)
+async def get_remote_about(remote: str) -> tuple[int, int]:
+    """
+    Lấy (total, free) của remote bằng rclone about, mỗi remote chỉ gọi một lần trong một lần chạy
+    """
+    if remote not in RemoteAbout:
         cmd = ["rclone", "about", f"{remote}:", "--json"]
         logger.info(f"🔍 Đang lấy thông tin dung lượng trống từ {remote}")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            encoding="utf-8",
-            check=True
-        )
+        result = await run_rclone(cmd)
         data = json.loads(result.stdout)
-        total = int(data["total"])
-        free = int(data["free"])
-        percent_free = (free / total) * 100 if total > 0 else 0
-        return True, percent_free, free
+        RemoteAbout[remote] = (int(data["total"]), int(data["free"]))
+    return RemoteAbout[remote]
+
+async def get_gdrive_free_space_percent_from_path(remote_path: str) -> tuple[bool, float | str, int]:
+    try:
+        remote = extract_remote_name(remote_path)
     except ValueError as ve:
         logger.error(f"❌ Lỗi chuỗi input: {ve}")
-        return False, f"Lỗi chuỗi input: {ve}"
+        return False, f"Lỗi chuỗi input: {ve}", 0
+    try:
+        total, free = await get_remote_about(remote)
     except subprocess.CalledProcessError as e:
         logger.error(f"❌ Lỗi khi chạy rclone: {e.stderr.strip()}")
-        return False, f"Lỗi chạy rclone: {e.stderr.strip()}"
+        return False, f"Lỗi chạy rclone: {e.stderr.strip()}", 0
     except (KeyError, ValueError, json.JSONDecodeError) as e:
         logger.error(f"❌ Lỗi xử lý dữ liệu JSON: {e}")
-        return False, f"Lỗi xử lý dữ liệu JSON: {e}"
+        return False, f"Lỗi xử lý dữ liệu JSON: {e}", 0
+    percent_free = (free / total) * 100 if total > 0 else 0
+    return True, percent_free, free
+
+def json_file_exists(file_path: str) -> bool:
+    """
+    Kiểm tra file JSON (bản nén .gz hoặc file .json cũ) đã tồn tại chưa
+    """
+    return os.path.exists(f"{file_path}.gz") or os.path.exists(file_path)
+
+def load_json_from_file(file_path: str):
+    """
+    Đọc file JSON, ưu tiên bản nén .gz và vẫn đọc được file .json cũ
+    """
+    if os.path.exists(f"{file_path}.gz"):
+        with gzip.open(f"{file_path}.gz", 'rb') as f:
+            return orjson.loads(f.read())
+    with open(file_path, 'rb') as f:
+        return orjson.loads(f.read())
+
+def load_jsonl_from_file(file_path: str) -> List[Dict]:
+    """
+    Đọc file JSON Lines nén gzip (file_path + ".gz") đã lưu bằng save_jsonl_to_file
+    """
+    with gzip.open(f"{file_path}.gz", 'rb') as f:
+        return [orjson.loads(line) for line in f]
+
+def save_jsonl_to_file(items: Iterable[Dict], file_path: str):
+    """
+    Lưu từng phần tử thành một dòng JSON vào file nén gzip (file_path + ".gz").
+    Ghi ra file tạm rồi mới đổi tên để lỗi giữa chừng không để lại cache dở dang
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_file = f"{file_path}.gz.tmp"
+    try:
+        with gzip.open(tmp_file, 'wb', compresslevel=1) as f:
+            for item in items:
+                f.write(orjson.dumps(item) + b"\n")
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, f"{file_path}.gz")
+    logger.info(f"✅ Đã lưu dữ liệu vào {file_path}")
 
 def save_json_to_file(data: json, file_path: str):
     """
-    Lưu dữ liệu vào file JSON
+    Lưu dữ liệu vào file JSON nén gzip (file_path + ".gz")
     """
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with gzip.open(f"{file_path}.gz", 'wb', compresslevel=1) as f:
+        f.write(orjson.dumps(data))
+    # Bản .json cũ (chuyển từ bản trước) đã được thay bằng bản .gz
+    if os.path.exists(file_path):
+        os.remove(file_path)
     logger.info(f"✅ Đã lưu dữ liệu vào {file_path}")
 
 
-def sync_files():
-    setup_logging()
-    total_copied = 0
-    total_size_copied = 0
-    stop_time = datetime.datetime.now().replace(hour=23, minute=0, second=0, microsecond=0)
-    logger.info(f"⏰ Script sẽ dừng lúc {stop_time.strftime('%H:%M:%S')}")
+def plan_copy_chunks(files: List[Dict], free_space: int, progress: Dict) -> List[List[Dict]]:
+    """
+    Chia danh sách file thành các lô FILES_FROM_CHUNK_SIZE file, cộng dồn kích thước
+    trước khi copy để không vượt MAX_TRANSFER_GB và dung lượng trống ở đích
+    """
+    max_bytes_left = CONFIG["MAX_TRANSFER_GB"] * (1024 ** 3) - progress["size"]
+    chunks = []
+    chunk = []
+    planned_size = 0
+    for index, file in enumerate(files):
+        if planned_size >= max_bytes_left:
+            logger.info("📦 Đạt giới hạn %sGB, bỏ qua %s file còn lại", CONFIG['MAX_TRANSFER_GB'], len(files) - index)
+            break
+        # Size -1 (không biết kích thước) không được trừ vào dung lượng đã tính
+        file_size = max(file.get("Size", 0), 0)
+        if (progress["size"] + planned_size + file_size) > free_space:
+            logger.error("❌ Không đủ dung lượng trống để copy file: %s", file['Path'])
+            continue
+        chunk.append(file)
+        planned_size += file_size
+        if len(chunk) >= CONFIG["FILES_FROM_CHUNK_SIZE"]:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
-    parser = argparse.ArgumentParser(description="Rclone sync script with command-line transfers")
-    parser.add_argument('--transfers', nargs='+', required=True, 
-                       help="List of source,destination pairs (e.g., 'GDrive60TB:PhimHoatHinh,30TB:PhimHoatHinh')")
-    args = parser.parse_args()
+def write_files_from(paths: List[str]) -> str:
+    """
+    Ghi danh sách đường dẫn ra file tạm cho --files-from-raw, trả về đường dẫn file tạm
+    """
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.txt', delete=False) as f:
+        f.write("\n".join(paths))
+        return f.name
 
-    transfers = parse_transfers(args.transfers)
-    if not transfers:
-        logger.error("❌ Không có cặp source-destination hợp lệ được cung cấp")
-        return
+async def _copy_chunk(chunk: List[Dict], source: str, destination: str, free_space: int,
+                      hash_algo: Optional[str], progress: Dict) -> tuple[List[str], str]:
+    """
+    Copy một lô file bằng một lệnh rclone copy --files-from-raw, sau đó kiểm tra kích thước/hash
+    ở đích bằng một lệnh rclone lsjson. File không khớp được copy lại từng file bằng _copy_one.
+    Trả về (danh sách file copy thành công, thông báo lỗi của rclone nếu có).
+    """
+    async with copy_slots:
+        chunk_size = sum(max(file.get("Size", 0), 0) for file in chunk)
+        logger.info("🚚 Đang copy lô %s file (%.2f MB) từ %s", len(chunk), chunk_size/(1024**2), source)
+        files_from = write_files_from([file['Path'] for file in chunk])
+        try:
+            error_msg = ""
+            cmd = ["rclone", "copy", source, destination, "--files-from-raw", files_from,
+                   "--transfers", str(CONFIG["COPY_TRANSFERS"])] + CONFIG["RCLONE_ARGS"] + RateLimitArgs
+            try:
+                await run_rclone(cmd, capture_stdout=False)
+            except subprocess.CalledProcessError as e:
+                error_msg = f"Exit code {e.returncode}: {e.stderr}"
+                logger.error("❌ Lỗi khi copy lô %s file: %s", len(chunk), error_msg)
+                if is_quota_exceeded(error_msg):
+                    return [], error_msg
+            # Các thư mục đích của lô đã thay đổi, bỏ cache lsf của các thư mục đó
+            for file in chunk:
+                DestDirListing.pop(os.path.dirname(f"{destination}/{file['Path']}"), None)
+
+            cmd = ["rclone", "lsjson", destination, "-R", "--files-only", "--files-from-raw", files_from]
+            if hash_algo is not None:
+                cmd.append("--hash")
+            try:
+                dest_files = {f['Path']: f for f in json.loads((await run_rclone(cmd)).stdout)}
+            except subprocess.CalledProcessError as e:
+                logger.warning("⚠️ Không thể kiểm tra lô file tại %s: %s", destination, e.stderr)
+                dest_files = {}
+        finally:
+            os.remove(files_from)
+
+        files_success = []
+        files_retry = []
+        for file in chunk:
+            dest_file = dest_files.get(file['Path'])
+            src_hash = file.get('Hashes', {}).get(hash_algo, '') if hash_algo else ''
+            dest_hash = dest_file.get('Hashes', {}).get(hash_algo, '') if dest_file and hash_algo else ''
+            if dest_file and is_same_size(file.get("Size", 0), dest_file['Size']) and (not src_hash or src_hash == dest_hash):
+                logger.info("✅ Copy thành công: %s (hash: %s)", file['Path'], src_hash or "không kiểm tra")
+                progress["copied"] += 1
+                progress["size"] += max(file.get("Size", 0), 0)
+                files_success.append(file['Path'])
+            else:
+                logger.error("❌ File chưa khớp sau khi copy lô: %s (src: %s, dest: %s)", file['Path'], src_hash, dest_hash)
+                files_retry.append(file)
+
+        for file in files_retry:
+            logger.info("🔄 Thử copy lại: %s", file['Path'])
+            success, error_msg = await _copy_one(file, source, destination, free_space, hash_algo, progress)
+            if success:
+                files_success.append(file['Path'])
+            elif error_msg and is_quota_exceeded(error_msg):
+                break
+        return files_success, error_msg
+
+async def _copy_one(file: Dict, source: str, destination: str, free_space: int,
+                    hash_algo: Optional[str], progress: Dict) -> tuple[bool, str]:
+    """
+    Copy một file từ source sang destination, kiểm tra hash và thử lại nếu cần.
+    Trả về (thành công, thông báo lỗi của rclone nếu có).
+    """
+    src_path = f"{source}/{file['Path']}"
+    dest_path = f"{destination}/{file['Path']}"
+    file_size = max(file.get("Size", 0), 0)
+
+    if (progress["size"] + file_size) > free_space:
+        logger.error("❌ Không đủ dung lượng trống trên %s để copy file: %s", destination, file['Path'])
+        return False, ""
+    logger.info("✅ Dung lượng trống (%.2f MB) đủ để copy file: %s with size %.2f MB", free_space/(1024**2), file['Path'], file_size/(1024**2))
+
+    # File nguồn đã có trong danh sách liệt kê, không kiểm tra lại trước khi copy
+    logger.info("🚚 Đang copy: %s (%.2f MB)", file['Path'], file_size/(1024**2))
+    success, error_msg = await run_rclone_copy(src_path, dest_path)
+    if not success:
+        # Kiểm tra quota trước: output của rclone có thể chứa cả lỗi quota lẫn lỗi khác
+        if not is_quota_exceeded(error_msg) and SOURCE_MISSING_RE.search(error_msg):
+            logger.error("❌ File nguồn không tồn tại: %s: %s", src_path, error_msg)
+            return False, error_msg
+        logger.error("❌ Lỗi khi copy %s: %s", file['Path'], error_msg)
+        return False, error_msg
+
+    if hash_algo is None:
+        logger.info("✅ Copy thành công: %s nhưng không kiểm tra hash", file['Path'])
+    else:
+        # Hash nguồn đã có sẵn trong danh sách rclone ls --hash, chỉ gọi hashsum khi thiếu
+        src_hash = file.get('Hashes', {}).get(hash_algo, '') or await get_file_hash(src_path, hash_algo)
+        dest_hash = await get_file_hash(dest_path, hash_algo)
+        if src_hash and dest_hash and src_hash == dest_hash:
+            logger.info("✅ Copy thành công: %s (hash: %s)", file['Path'], src_hash)
+        else:
+            logger.error("❌ Hash không khớp: %s (src: %s, dest: %s)", file['Path'], src_hash, dest_hash)
+            if not await delete_file(dest_path):
+                logger.warning("⚠️ Không thể xóa file lỗi: %s", file['Path'])
+                return False, ""
+            logger.info("🗑️ Đã xóa file lỗi: %s", file['Path'])
+            logger.info("🔄 Thử copy lại: %s", file['Path'])
+            success, error_msg = await run_rclone_copy(src_path, dest_path)
+            if not success:
+                logger.error("❌ Lỗi khi copy lại %s: %s", file['Path'], error_msg)
+                return False, error_msg
+            dest_hash = await get_file_hash(dest_path, hash_algo)
+            if not (src_hash and dest_hash and src_hash == dest_hash):
+                logger.error("❌ Copy lại thất bại, hash vẫn không khớp: %s", file['Path'])
+                return False, ""
+            logger.info("✅ Copy lại thành công: %s (hash: %s)", file['Path'], src_hash)
+
+    progress["copied"] += 1
+    progress["size"] += file_size
+    return True, ""
+
+
+async def main(transfers: List[Dict]):
+    progress = {"copied": 0, "size": 0}
+    now = datetime.datetime.now()
+    stop_time = now.replace(hour=23, minute=0, second=0, microsecond=0)
+    # Kiểm tra giờ dừng và giới hạn dung lượng bằng số học thuần trong vòng lặp copy
+    stop_monotonic = time.monotonic() + (stop_time - now).total_seconds()
+    max_bytes = CONFIG["MAX_TRANSFER_GB"] * (1024 ** 3)
+    logger.info(f"⏰ Script sẽ dừng lúc {stop_time.strftime('%H:%M:%S')}")
 
     for transfer in transfers:
         source = transfer["SOURCE"]
         destination = transfer["DESTINATION"]
-        success, percent,free_space = get_gdrive_free_space_percent_from_path(destination)
+        success, percent,free_space = await get_gdrive_free_space_percent_from_path(destination)
         if not success:
             logger.error(f"❌ Không thể lấy thông tin dung lượng trống từ {destination}: {percent}")
             continue
@@ -342,14 +763,13 @@ def sync_files():
         if remote_source_type == remote_dest_type and remote_source_type == "drive":
             hash_algo = "md5"
         elif remote_source_type == remote_dest_type and remote_source_type == "onedrive":
-            hash_algo = "QuickXorHash"
+            hash_algo = "quickxor"
         else:
             hash_algo = None
         logger.info(f"🔍 Sử dụng thuật toán hash: {hash_algo} cho {remote_source_type} và {remote_dest_type}")
-        files = get_files_to_copy(source, destination, hash_algo)
+        files, source_has_files = await get_files_to_copy(source, destination, hash_algo)
         if not files:
-            source_files = get_cached_files(source, is_source=True)
-            if source_files:
+            if source_has_files:
                 logger.info(f"✅ Không có file cần copy từ {source} den {destination}: tất cả file đã tồn tại ở đích")
             else:
                 logger.error(f"❌ Không thể lấy danh sách file từ {source}")
@@ -358,85 +778,81 @@ def sync_files():
         logger.info(f"📂 Tổng số file cần xử lý từ {source}: {len(files)}")
         success_cache_file_name = get_cached_sync_source_file_name_success(source, destination)
         files_success = []
-        for file in files:
-            current_time = datetime.datetime.now()
-            if current_time >= stop_time:
-                logger.info(f"⏰ Đã đến {current_time.strftime('%H:%M:%S')}, dừng script")
-                logger.info(f"🏁 Hoàn tất - Copied: {total_copied} files, Size: {total_size_copied/(1024**3):.2f} GB")
-                return
-            
-            logger.info(f"📏 Tổng kích thước đã copy: {total_size_copied/(1024**3):.2f} GB")
-            if total_size_copied / (1024 ** 3) >= CONFIG["MAX_TRANSFER_GB"]:
+        stopped = False
+        if time.monotonic() >= stop_monotonic:
+            logger.info(f"⏰ Đã đến {datetime.datetime.now().strftime('%H:%M:%S')}, dừng script")
+            break
+        # Đích sắp thay đổi, lần chạy sau phải liệt kê lại đích
+        invalidate_cached_files(destination, is_source=False)
+        chunks = plan_copy_chunks(files, free_space, progress)
+        # Chia giới hạn theo số lô thực sự chạy đồng thời: ít lô thì mỗi tiến trình được phần lớn hơn
+        set_rate_limits(min(CONFIG["MAX_CONCURRENT_RCLONE"], len(chunks)))
+        # Mỗi lô file là một task; copy_slots giới hạn số lô copy đồng thời
+        pending = {
+            asyncio.create_task(_copy_chunk(chunk, source, destination, free_space, hash_algo, progress))
+            for chunk in chunks
+        }
+        while pending:
+            # Hết giờ khi các lô còn đang chạy: hủy luôn thay vì chờ lô hiện tại xong
+            timeout = max(0, stop_monotonic - time.monotonic())
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    chunk_success, error_msg = task.result()
+                except Exception as e:
+                    # Lỗi của một lô (JSON hỏng, lỗi file tạm...) không dừng các lô còn lại
+                    logger.error("❌ Lỗi khi xử lý lô file từ %s: %s", source, e)
+                    continue
+                if chunk_success:
+                    files_success.extend(chunk_success)
+                    # Lưu file thành công vào cache
+                    save_json_to_file(files_success, success_cache_file_name)
+                if error_msg and is_quota_exceeded(error_msg):
+                    logger.error(f"❌ Dừng do vượt quota: {error_msg}")
+                    stopped = True
+            if stopped:
+                break
+
+            if time.monotonic() >= stop_monotonic:
+                logger.info(f"⏰ Đã đến {datetime.datetime.now().strftime('%H:%M:%S')}, dừng script")
+                stopped = True
+                break
+
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("📏 Tổng kích thước đã copy: %.2f GB", progress['size']/(1024**3))
+            if progress["size"] >= max_bytes:
                 logger.info(f"📦 Đạt giới hạn {CONFIG['MAX_TRANSFER_GB']}GB")
-                return
-            
+                stopped = True
+                break
+        if stopped:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            break
+        logger.info(f"📦 Đã hoàn thành đồng bộ từ {source} đến {destination}")
 
-            src_path = f"{source}/{file['Path']}"
-            dest_path = f"{destination}/{file['Path']}"
-            file_size = file.get("Size", 0)
+    logger.info(f"🏁 Hoàn tất - Copied: {progress['copied']} files, Size: {progress['size']/(1024**3):.2f} GB")
 
-            if (total_size_copied + file_size) > free_space:
-                logger.error(f"❌ Không đủ dung lượng trống trên {destination} để copy file: {file['Path']}")
-                continue
-            else:
-                logger.info(f"✅ Dung lượng trống ({free_space/(1024**2):.2f} MB) đủ để copy file: {file['Path']} with size {file_size/(1024**2):.2f} MB")
-            # Kiểm tra file nguồn
-            try:
-                src_exists = bool(rclone.ls(src_path))
-                if not src_exists:
-                    logger.error(f"❌ File nguồn không tồn tại: {src_path}")
-                    continue
-            except Exception as e:
-                logger.error(f"❌ Lỗi khi kiểm tra file nguồn {src_path}: {str(e)}")
-                continue
 
-            logger.info(f"🚚 Đang copy: {file['Path']} ({file_size/(1024**2):.2f} MB)")
-            success, error_msg = run_rclone_copy(src_path, dest_path)
-            
-            if success and hash_algo is not None:
-                src_hash = get_file_hash(src_path, hash_algo)
-                dest_hash = get_file_hash(dest_path, hash_algo)
-                if src_hash and dest_hash and src_hash == dest_hash:
-                    logger.info(f"✅ Copy thành công: {file['Path']} (hash: {src_hash})")
-                    total_copied += 1
-                    total_size_copied += file_size
-                    files_success.append(file['Path'])
-                else:
-                    logger.error(f"❌ Hash không khớp: {file['Path']} (src: {src_hash}, dest: {dest_hash})")
-                    if delete_file(dest_path):
-                        logger.info(f"🗑️ Đã xóa file lỗi: {file['Path']}")
-                        logger.info(f"🔄 Thử copy lại: {file['Path']}")
-                        success, error_msg = run_rclone_copy(src_path, dest_path)
-                        if success:
-                            src_hash = get_file_hash(src_path, hash_algo)
-                            dest_hash = get_file_hash(dest_path, hash_algo)
-                            if src_hash and dest_hash and src_hash == dest_hash:
-                                logger.info(f"✅ Copy lại thành công: {file['Path']} (hash: {src_hash})")
-                                total_copied += 1
-                                total_size_copied += file_size
-                                files_success.append(file['Path'])
-                            else:
-                                logger.error(f"❌ Copy lại thất bại, hash vẫn không khớp: {file['Path']}")
-                        else:
-                            logger.error(f"❌ Lỗi khi copy lại {file['Path']}: {error_msg}")
-                    else:
-                        logger.warning(f"⚠️ Không thể xóa file lỗi: {file['Path']}")
-            elif success and hash_algo is None:
-                logger.info(f"✅ Copy thành công: {file['Path']} nhưng không kiểm tra hash (không hỗ trợ {remote_source_type} và {remote_dest_type})")
-                total_copied += 1
-                total_size_copied += file_size
-                files_success.append(file['Path'])
-            else:
-                logger.error(f"❌ Lỗi khi copy {file['Path']}: {error_msg}")
-                if is_quota_exceeded(error_msg):
-                    logger.error(f"❌ Dừng do vượt quota: {error_msg}")
-                    return
-                continue
-            # Lưu file thành công vào cache
-            save_json_to_file(files_success, success_cache_file_name)
-        logger.info(f"📦 Đã hoàn thành đồng bộ từ {source} đến {destination}")
+def sync_files():
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Rclone sync script with command-line transfers")
+    parser.add_argument('--transfers', nargs='+', required=True, 
+                       help="List of source,destination pairs (e.g., 'GDrive60TB:PhimHoatHinh,30TB:PhimHoatHinh')")
+    parser.add_argument('--verbose', action='store_true',
+                       help="Enable DEBUG logs for this script and pass --log-level DEBUG to rclone copy")
+    args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+        CONFIG["RCLONE_ARGS"] += ["--log-level", "DEBUG"]
+
+    transfers = parse_transfers(args.transfers)
+    if not transfers:
+        logger.error("❌ Không có cặp source-destination hợp lệ được cung cấp")
+        return
 
-    logger.info(f"🏁 Hoàn tất - Copied: {total_copied} files, Size: {total_size_copied/(1024**3):.2f} GB")
+    asyncio.run(main(transfers))
 
 if __name__ == "__main__":
     sync_files()
\ No newline at end of file